@@ -1,14 +1,18 @@
 from flask import Flask, request, jsonify
 import cv2
 import numpy as np
+import hashlib
 import os
 import tempfile
+import threading
 from werkzeug.utils import secure_filename
 from flask_cors import CORS
 from typing import Dict, List, Tuple, Optional
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from enum import Enum
 import logging
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from squatPosture import analyze_squat
 from sittingPosture import analyze_sitting
@@ -16,6 +20,13 @@ from sittingPosture import analyze_sitting
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# xxhash is optional; it hashes uploads at several GB/s, but the stdlib
+# fallback is still cheap next to pose inference
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 class AnalysisType(Enum):
     """Enum for analysis types"""
     SQUAT = "squat"
@@ -38,6 +49,14 @@ class AnalysisResult:
     score: int
     analysis_type: str
 
+@dataclass(slots=True)
+class FrameAnalysis:
+    """Data class for a single analyzed frame"""
+    timestamp: float
+    frame_number: int
+    feedback: List[str]
+    issues_count: int
+
 @dataclass
 class VideoStats:
     """Data class for video statistics"""
@@ -56,8 +75,21 @@ class PostureAnalyzer:
     @classmethod
     def is_allowed_file(cls, filename: str) -> bool:
         """Check if file extension is allowed"""
-        return ('.' in filename and 
+        return ('.' in filename and
                 filename.rsplit('.', 1)[1].lower() in cls.ALLOWED_EXTENSIONS)
+
+    @staticmethod
+    def is_video_content(head: bytes) -> bool:
+        """Check the upload's first bytes for a supported container signature"""
+        if len(head) < 12:
+            return False
+        if head[4:8] == b'ftyp':  # mp4 / mov
+            return True
+        if head[:4] == b'RIFF' and head[8:12] == b'AVI ':  # avi
+            return True
+        if head[:4] == b'\x1a\x45\xdf\xa3':  # mkv / webm (EBML)
+            return True
+        return False
     
     @classmethod
     def format_analysis_response(cls, feedback_list: List[str], 
@@ -96,18 +128,24 @@ class PostureAnalyzer:
         )
     
     @classmethod
-    def analyze_single_frame(cls, frame: np.ndarray, 
+    def dispatch_analysis(cls, frame: np.ndarray,
+                          analysis_type: AnalysisType) -> Tuple[bool, List[str]]:
+        """Run the analyzer for the given type; exceptions propagate"""
+        if frame is None or frame.size == 0:
+            logger.error("Empty frame received")
+            return False, ["Empty frame - check camera input"]
+
+        if analysis_type == AnalysisType.SITTING:
+            return analyze_sitting(frame)
+        else:
+            return analyze_squat(frame)
+
+    @classmethod
+    def analyze_single_frame(cls, frame: np.ndarray,
                              analysis_type: AnalysisType) -> Tuple[bool, List[str]]:
         """Analyze a single frame based on analysis type"""
         try:
-            if frame is None or frame.size == 0:
-                logger.error("Empty frame received")
-                return False, ["Empty frame - check camera input"]
-
-            if analysis_type == AnalysisType.SITTING:
-                return analyze_sitting(frame)
-            else:
-                return analyze_squat(frame)
+            return cls.dispatch_analysis(frame, analysis_type)
         except Exception as e:
             logger.exception(f"Critical error in {analysis_type.value} analysis:")
             return False, [f"Analysis failed: {str(e)}"]
@@ -122,51 +160,95 @@ class PostureAnalyzer:
             if not cap.is_opened():
                 raise ValueError("Could not open video file")
             
-            frame_count = 0
             analyzed_frames = 0
-            all_feedback = []
-            frame_analyses = []
-            
+            total_issues = 0
+            # Count feedback incrementally: memory stays bounded by the
+            # number of distinct messages, not total feedback items
+            feedback_counter = Counter()
+
             # Get video properties
             fps = cap.get_fps()
             total_frames = cap.get_frame_count()
             duration = total_frames / fps if fps > 0 else 0
+
+            # Preallocate per-frame storage: one slotted record per frame
+            # plus two flat timeline arrays, instead of building two dicts
+            # per sampled frame. expected_n is a guess when the backend
+            # cannot report a frame count; storage doubles on overflow.
+            # total_frames comes from container metadata the uploader
+            # controls, so cap the up-front allocation - a forged header
+            # must not be able to request gigabytes before a single frame
+            # decodes, and real overflow just hits the doubling path.
+            expected_n = (min(total_frames // frame_interval + 1, 16384)
+                          if total_frames > 0 else 16)
+            frame_analyses: List[Optional[FrameAnalysis]] = [None] * expected_n
+            timeline_ts = np.empty(expected_n, dtype=np.float32)
+            timeline_counts = np.empty(expected_n, dtype=np.int32)
+
+            def collect_result(frame_number: int, future) -> None:
+                nonlocal analyzed_frames, total_issues
+                nonlocal frame_analyses, timeline_ts, timeline_counts
+                try:
+                    _, feedback = future.result()
+
+                    index = analyzed_frames
+                    if index >= len(frame_analyses):
+                        frame_analyses.extend([None] * len(frame_analyses))
+                        timeline_ts = np.resize(timeline_ts, 2 * index)
+                        timeline_counts = np.resize(timeline_counts, 2 * index)
+
+                    # Store frame analysis with timestamp
+                    timestamp = round(frame_number / fps, 2) if fps > 0 else 0
+                    frame_analyses[index] = FrameAnalysis(
+                        timestamp=timestamp,
+                        frame_number=frame_number,
+                        feedback=feedback,
+                        issues_count=len(feedback)
+                    )
+                    timeline_ts[index] = timestamp
+                    timeline_counts[index] = len(feedback)
+
+                    # Collect all feedback for overall analysis
+                    feedback_counter.update(feedback)
+                    total_issues += len(feedback)
+                    analyzed_frames += 1
+
+                except Exception as e:
+                    logger.error(f"Error analyzing frame {frame_number}: {e}")
+
+            # Pipeline the single decoder thread (VideoCapture is not
+            # thread-safe) with a pool of pose-inference workers; MediaPipe
+            # releases the GIL during inference so threads scale on cores.
+            # Collecting in submission order keeps frame_analyses sorted,
+            # and bounding the in-flight queue caps frames held in memory.
+            max_workers = max(1, (os.cpu_count() or 2) - 1)
+            max_pending = 2 * max_workers
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pending = deque()
+                for frame_number, frame in cls._sampled_frames(
+                        cap, total_frames, frame_interval, fps):
+                    pending.append((frame_number, executor.submit(
+                        cls.analyze_single_frame, frame, analysis_type)))
+                    if len(pending) >= max_pending:
+                        collect_result(*pending.popleft())
+                while pending:
+                    collect_result(*pending.popleft())
             
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                    
-                # Analyze every nth frame to avoid overprocessing
-                if frame_count % frame_interval == 0:
-                    try:
-                        _, feedback = cls.analyze_single_frame(frame, analysis_type)
-                        
-                        # Store frame analysis with timestamp
-                        timestamp = frame_count / fps if fps > 0 else 0
-                        frame_analysis = {
-                            "timestamp": round(timestamp, 2),
-                            "frame_number": frame_count,
-                            "feedback": feedback,
-                            "issues_count": len(feedback)
-                        }
-                        frame_analyses.append(frame_analysis)
-                        
-                        # Collect all feedback for overall analysis
-                        all_feedback.extend(feedback)
-                        analyzed_frames += 1
-                        
-                    except Exception as e:
-                        logger.error(f"Error analyzing frame {frame_count}: {e}")
-                
-                frame_count += 1
-            
+            # Trim unused preallocated slots and serialize the timeline
+            del frame_analyses[analyzed_frames:]
+            timeline_data = [
+                {"timestamp": round(ts, 2), "issues_count": count}
+                for ts, count in zip(timeline_ts[:analyzed_frames].tolist(),
+                                     timeline_counts[:analyzed_frames].tolist())
+            ]
+
             # Calculate overall statistics
-            unique_feedback = list(set(all_feedback))
-            average_issues = len(all_feedback) / analyzed_frames if analyzed_frames > 0 else 0
-            
-            # Find most common issues
-            most_common_issues = cls._get_most_common_issues(all_feedback)
+            unique_feedback = list(feedback_counter)
+            average_issues = total_issues / analyzed_frames if analyzed_frames > 0 else 0
+            most_common_issues = [
+                {"issue": issue, "count": count}
+                for issue, count in feedback_counter.most_common(5)
+            ]
             
             # Create response
             analysis_result = cls.format_analysis_response(unique_feedback, mode)
@@ -181,37 +263,106 @@ class PostureAnalyzer:
             return {
                 "overall_analysis": analysis_result.__dict__,
                 "video_stats": video_stats.__dict__,
-                "frame_analyses": frame_analyses,
+                "frame_analyses": [asdict(analysis) for analysis in frame_analyses],
                 "most_common_issues": most_common_issues,
-                "timeline_data": [
-                    {
-                        "timestamp": analysis["timestamp"],
-                        "issues_count": analysis["issues_count"]
-                    }
-                    for analysis in frame_analyses
-                ]
+                "timeline_data": timeline_data
             }
     
     @staticmethod
-    def _get_most_common_issues(all_feedback: List[str], top_n: int = 5) -> List[Dict]:
-        """Get most common issues from feedback list"""
-        feedback_counts = {}
-        for feedback_item in all_feedback:
-            feedback_counts[feedback_item] = feedback_counts.get(feedback_item, 0) + 1
-        
-        most_common = sorted(feedback_counts.items(), key=lambda x: x[1], reverse=True)[:top_n]
-        return [{"issue": issue, "count": count} for issue, count in most_common]
+    def _sampled_frames(cap: 'VideoCapture', total_frames: int,
+                        frame_interval: int, fps: float):
+        """Yield (frame_number, frame) for every nth frame of the video.
+
+        Seeks directly to each sampled frame so the decoder only works
+        forward from the nearest keyframe instead of decoding every frame
+        in between. The seek path is only taken after a probe seek+read
+        whose reported timestamp lands where it should; containers that
+        seek inaccurately (e.g. VBR webm), backends that cannot seek at
+        all, and videos with no usable frame count or fps fall back to
+        serial grab()/retrieve() scanning.
+        """
+        use_seek = False
+        if total_frames > frame_interval and fps > 0 and cap.seek(frame_interval):
+            ret, _ = cap.read()
+            if ret:
+                # The read leaves the decoder one frame past the probe
+                # target; an inaccurate seek shows up as a reported
+                # timestamp far from where we asked to land
+                expected_ms = (frame_interval + 1) * 1000.0 / fps
+                tolerance_ms = 0.5 * frame_interval * 1000.0 / fps
+                use_seek = abs(cap.get_pos_msec() - expected_ms) <= tolerance_ms
+            # Rewind the probe before either path starts reading
+            use_seek = cap.seek(0) and use_seek
+        if use_seek:
+            for target in range(0, total_frames, frame_interval):
+                cap.seek(target)
+                ret, frame = cap.read()
+                if not ret:
+                    return
+                yield target, frame
+            return
+
+        # Serial fallback: advance with grab(), decode only sampled frames
+        frame_count = 0
+        while cap.grab():
+            if frame_count % frame_interval == 0:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    return
+                yield frame_count, frame
+            frame_count += 1
 
 class VideoCapture:
     """Context manager for OpenCV VideoCapture"""
-    
+
+    # GStreamer pipeline routing H.264 decode through NVDEC hardware on
+    # hosts whose OpenCV build ships GStreamer plus the NVIDIA plugins
+    NVDEC_PIPELINE = (
+        "filesrc location={path} ! qtdemux ! h264parse ! nvv4l2decoder ! "
+        "nvvidconv ! video/x-raw,format=BGRx ! videoconvert ! "
+        "video/x-raw,format=BGR ! appsink"
+    )
+
     def __init__(self, video_path: str):
         self.video_path = video_path
         self.cap = None
-    
+        # Properties recovered from a default-backend probe when decoding
+        # through a pipeline that cannot report them itself
+        self._fps = None
+        self._frame_count = None
+
     def __enter__(self):
-        self.cap = cv2.VideoCapture(self.video_path)
+        self.cap = self._open_capture()
+        # Keep internal buffering minimal; frames are pulled on demand
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         return self
+
+    def _open_capture(self) -> cv2.VideoCapture:
+        """Open the video on the fastest decode backend available"""
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            return cap
+
+        # Only mp4/mov goes through qtdemux, so gate the hardware route on
+        # the container. Builds without GStreamer or the NVIDIA decoder
+        # simply fail to open the pipeline and fall through to CPU FFmpeg.
+        # The pipeline cannot seek or report fps/frame count, so those are
+        # kept from the default-backend open above and analysis uses its
+        # serial grab()/retrieve() fallback for the actual decode.
+        if self.video_path.lower().endswith(('.mp4', '.mov')):
+            gst_cap = cv2.VideoCapture(
+                self.NVDEC_PIPELINE.format(path=self.video_path),
+                cv2.CAP_GSTREAMER)
+            if gst_cap.isOpened():
+                self._fps = cap.get(cv2.CAP_PROP_FPS)
+                self._frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+                cap.release()
+                logger.info("Video decode backend: NVDEC via GStreamer")
+                return gst_cap
+            gst_cap.release()
+
+        logger.info(f"Video decode backend: {cap.getBackendName()}")
+        return cap
     
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.cap:
@@ -222,17 +373,47 @@ class VideoCapture:
     
     def read(self) -> Tuple[bool, np.ndarray]:
         return self.cap.read()
+
+    def grab(self) -> bool:
+        return self.cap.grab()
+
+    def seek(self, frame_index: int) -> bool:
+        """Position the decoder at frame_index; True if the backend accepted it.
+
+        The position readback only catches backends that cannot seek at
+        all (FFmpeg echoes the requested frame regardless) - seek accuracy
+        is probed separately via get_pos_msec() after a real read.
+        """
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        return int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame_index
+
+    def retrieve(self) -> Tuple[bool, np.ndarray]:
+        return self.cap.retrieve()
+
+    def get_pos_msec(self) -> float:
+        return self.cap.get(cv2.CAP_PROP_POS_MSEC)
     
     def get_fps(self) -> float:
+        if self._fps is not None:
+            return self._fps
         return self.cap.get(cv2.CAP_PROP_FPS)
-    
+
     def get_frame_count(self) -> int:
+        if self._frame_count is not None:
+            return self._frame_count
         return int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
 @contextmanager
 def temporary_file(suffix: str = '.mp4'):
-    """Context manager for temporary files"""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+    """Context manager for temporary files, preferring RAM-backed storage"""
+    # Uploads round-trip through this file into the decoder; /dev/shm
+    # (tmpfs) keeps that traffic in RAM instead of on disk. Piping the
+    # upload straight into FFmpeg would avoid the file entirely, but
+    # pipes cannot seek and would forfeit the keyframe-jump sampling in
+    # analyze_video_frames.
+    tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix,
+                                     dir=tmp_dir) as tmp_file:
         temp_path = tmp_file.name
     try:
         yield temp_path
@@ -242,12 +423,24 @@ def temporary_file(suffix: str = '.mp4'):
 
 class PostureAPI:
     """Main API class"""
-    
+
+    # Uploads above this size decode at half resolution: libjpeg does the
+    # downscale in the DCT domain (~4x faster) and the result is still
+    # well above MediaPipe's operating resolution. Tiny thumbnails keep
+    # full-resolution decode.
+    REDUCED_DECODE_MIN_BYTES = 256 * 1024
+
+    # Frame endpoints often see the same upload repeatedly (client retry,
+    # dashboard refresh); cache their feedback keyed on the raw bytes
+    FRAME_CACHE_SIZE = 512
+
     def __init__(self):
         self.app = Flask(__name__)
         CORS(self.app)
         self.app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB
         self.analyzer = PostureAnalyzer()
+        self._frame_cache = OrderedDict()
+        self._frame_cache_lock = threading.Lock()
         self._register_routes()
     
     def _register_routes(self):
@@ -276,18 +469,54 @@ class PostureAPI:
         
         return file, None
     
-    def _decode_image_frame(self, file) -> tuple:
-        """Decode image frame from file"""
+    def _decode_image_bytes(self, data: bytes) -> tuple:
+        """Decode image frame from raw bytes"""
         try:
-            npimg = np.frombuffer(file.read(), np.uint8)
-            frame = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
-            
-            if frame is None:
+            npimg = np.frombuffer(data, np.uint8)
+            flags = (cv2.IMREAD_REDUCED_COLOR_2
+                     if len(data) >= self.REDUCED_DECODE_MIN_BYTES
+                     else cv2.IMREAD_COLOR)
+            frame = cv2.imdecode(npimg, flags)
+
+            if frame is None or frame.size == 0:
                 return None, (jsonify({'error': 'Invalid image format'}), 400)
-            
+
             return frame, None
         except Exception as e:
             return None, (jsonify({'error': f'Image decoding failed: {str(e)}'}), 500)
+
+    @staticmethod
+    def _hash_frame_bytes(data: bytes):
+        if xxhash is not None:
+            return xxhash.xxh64(data).intdigest()
+        return hashlib.sha1(data).digest()
+
+    def _analyze_frame_cached(self, file, analysis_type: AnalysisType) -> tuple:
+        """Analyze an uploaded frame, serving repeated uploads from cache"""
+        data = file.read()
+        # Hash the raw bytes before decoding - a cache hit skips both the
+        # JPEG decode and the pose inference
+        key = (self._hash_frame_bytes(data), analysis_type.value)
+        with self._frame_cache_lock:
+            feedback = self._frame_cache.get(key)
+            if feedback is not None:
+                self._frame_cache.move_to_end(key)
+                return feedback, None
+
+        frame, error = self._decode_image_bytes(data)
+        if error:
+            return None, error
+
+        # dispatch_analysis lets transient failures raise to the caller's
+        # error handler: only genuinely completed results enter the cache,
+        # so a one-off hiccup is retried instead of served stale on every
+        # repeat of the same bytes
+        _, feedback = self.analyzer.dispatch_analysis(frame, analysis_type)
+        with self._frame_cache_lock:
+            self._frame_cache[key] = feedback
+            while len(self._frame_cache) > self.FRAME_CACHE_SIZE:
+                self._frame_cache.popitem(last=False)
+        return feedback, None
     
     def _create_error_response(self, error_msg: str) -> tuple:
         """Create standardized error response"""
@@ -306,8 +535,17 @@ class PostureAPI:
             if error:
                 return error
             
+            # Sniff the container signature before spending up to 100MB of
+            # temp-storage I/O on a payload the decoder cannot open anyway
+            head = file.stream.read(16)
+            file.stream.seek(0)
+            if not self.analyzer.is_video_content(head):
+                return jsonify({
+                    'error': 'File content is not a supported video format'
+                }), 415
+
             mode = request.form.get('mode', AnalysisType.SQUAT.value)
-            
+
             with temporary_file() as temp_path:
                 file.save(temp_path)
                 result = self.analyzer.analyze_video_frames(temp_path, mode)
@@ -324,23 +562,13 @@ class PostureAPI:
             if error:
                 return error
             
-            frame, error = self._decode_image_frame(file)
-            if error:
-                return error
-            
-            # Add frame validation
-            if frame is None or frame.size == 0:
-                return jsonify({
-                    'error': 'Invalid frame data',
-                    'status': 'Analysis Error',
-                    'feedback': ['Empty frame received'],
-                    'score': 0
-                }), 400
-            
             mode = request.form.get('mode', AnalysisType.SQUAT.value)
             analysis_type = AnalysisType(mode)
-            
-            _, feedback = self.analyzer.analyze_single_frame(frame, analysis_type)
+
+            feedback, error = self._analyze_frame_cached(file, analysis_type)
+            if error:
+                return error
+
             response = self.analyzer.format_analysis_response(feedback, mode)
             
             return jsonify(response.__dict__)
@@ -364,11 +592,10 @@ class PostureAPI:
             if error:
                 return error
             
-            frame, error = self._decode_image_frame(file)
+            feedback, error = self._analyze_frame_cached(file, analysis_type)
             if error:
                 return error
-            
-            _, feedback = self.analyzer.analyze_single_frame(frame, analysis_type)
+
             response = self.analyzer.format_analysis_response(feedback, analysis_type.value)
             
             return jsonify(response.__dict__)
@@ -381,11 +608,10 @@ class PostureAPI:
         """Legacy squat analysis endpoint"""
         try:
             file = request.files['frame']
-            frame, error = self._decode_image_frame(file)
+            feedback, error = self._analyze_frame_cached(file, AnalysisType.SQUAT)
             if error:
                 return error
-            
-            _, feedback = self.analyzer.analyze_single_frame(frame, AnalysisType.SQUAT)
+
             return jsonify({'feedback': feedback})
             
         except Exception as e:
@@ -395,11 +621,10 @@ class PostureAPI:
         """Legacy sit analysis endpoint"""
         try:
             file = request.files['frame']
-            frame, error = self._decode_image_frame(file)
+            feedback, error = self._analyze_frame_cached(file, AnalysisType.SITTING)
             if error:
                 return error
-            
-            _, feedback = self.analyzer.analyze_single_frame(frame, AnalysisType.SITTING)
+
             return jsonify({'feedback': feedback})
             
         except Exception as e:
@@ -422,8 +647,39 @@ class PostureAPI:
         })
     
     def run(self, host='0.0.0.0', port=5001, debug=False):
-        """Run the Flask application"""
-        self.app.run(host=host, port=port, debug=debug)
+        """Run under gunicorn, falling back to the Flask dev server"""
+        if debug:
+            self.app.run(host=host, port=port, debug=True)
+            return
+
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            # Dev server serializes requests; each analysis holds the CPU
+            # for seconds, so at least enable threading
+            logger.warning("gunicorn not installed - falling back to the "
+                           "single-process Flask dev server")
+            self.app.run(host=host, port=port, threaded=True)
+            return
+
+        flask_app = self.app
+
+        class GunicornApp(BaseApplication):
+            def load_config(self):
+                self.cfg.set('bind', f'{host}:{port}')
+                self.cfg.set('workers', os.cpu_count() or 1)
+                self.cfg.set('worker_class', 'gthread')
+                self.cfg.set('threads', 4)
+                self.cfg.set('timeout', 300)
+                # The app object is built in the master before the fork
+                # (load() just returns it), so preload_app would be a
+                # no-op here; fork-safety rests on the analyzer modules
+                # constructing their Pose instances lazily per thread
+
+            def load(self):
+                return flask_app
+
+        GunicornApp().run()
 
 def create_app():
     """Factory function to create the Flask app"""
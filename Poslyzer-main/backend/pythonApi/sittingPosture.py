@@ -2,34 +2,96 @@ import cv2
 import mediapipe as mp
 import math
 import logging
+import threading
 import numpy as np
+from collections import namedtuple
 
 logger = logging.getLogger(__name__)
 
-# Initialize MediaPipe Pose
+# Numba is optional: when present the scalar geometry kernels compile to
+# native code, otherwise they run as plain Python
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def wrap(func):
+            return func
+        return wrap
+
+# Lightweight 2D point used for synthesized landmarks (midpoints)
+Pt = namedtuple('Pt', ['x', 'y'])
+
+# Initialize MediaPipe Pose lazily, one instance per thread: Pose objects
+# are not thread-safe and the video path analyzes frames on worker threads
 mp_pose = mp.solutions.pose
-pose = mp_pose.Pose(
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5,
-    model_complexity=1
-)
+_thread_local = threading.local()
+
+# Landmark indices as plain ints, resolved once instead of paying the
+# IntEnum attribute lookup on every frame
+NOSE = int(mp_pose.PoseLandmark.NOSE)
+LEFT_EAR = int(mp_pose.PoseLandmark.LEFT_EAR)
+RIGHT_EAR = int(mp_pose.PoseLandmark.RIGHT_EAR)
+LEFT_SHOULDER = int(mp_pose.PoseLandmark.LEFT_SHOULDER)
+RIGHT_SHOULDER = int(mp_pose.PoseLandmark.RIGHT_SHOULDER)
+LEFT_HIP = int(mp_pose.PoseLandmark.LEFT_HIP)
+RIGHT_HIP = int(mp_pose.PoseLandmark.RIGHT_HIP)
+
+def _get_pose():
+    pose = getattr(_thread_local, 'pose', None)
+    if pose is None:
+        pose = mp_pose.Pose(
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5,
+            model_complexity=1
+        )
+        _thread_local.pose = pose
+    return pose
+
+# MediaPipe Pose detects at 256x256 internally, so feeding it more than
+# ~480px on the long edge only adds cvtColor/copy bandwidth, not accuracy
+MAX_INFERENCE_EDGE = 480
+
+def _downscale(frame):
+    """Shrink frame so its long edge is at most MAX_INFERENCE_EDGE"""
+    h, w = frame.shape[:2]
+    scale = MAX_INFERENCE_EDGE / max(h, w)
+    if scale < 1.0:
+        frame = cv2.resize(frame, None, fx=scale, fy=scale,
+                           interpolation=cv2.INTER_AREA)
+    return frame
+
+def _to_rgb(frame):
+    """Convert BGR to RGB into a reusable per-thread buffer"""
+    # Note: a frame[:, :, ::-1] view would skip cvtColor entirely, but
+    # MediaPipe needs contiguous input, and np.ascontiguousarray on the
+    # view allocates a fresh frame-sized copy per call - strictly worse
+    # than converting into this reused buffer
+    buf = getattr(_thread_local, 'rgb_buf', None)
+    if buf is None or buf.shape != frame.shape:
+        buf = np.empty_like(frame)
+        _thread_local.rgb_buf = buf
+    buf.flags.writeable = True
+    cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buf)
+    # Marking the buffer read-only lets MediaPipe skip its internal copy
+    buf.flags.writeable = False
+    return buf
+
+@njit(cache=True, fastmath=True)
+def vector_angle(ux, uy, vx, vy):
+    """Angle in degrees between two 2D vectors given as scalar floats"""
+    # atan2(cross, dot) avoids the arccos clamping issue and runs on
+    # plain floats - no per-call NumPy dispatch on 2-element arrays
+    cross = ux * vy - uy * vx
+    dot = ux * vx + uy * vy
+    return abs(math.degrees(math.atan2(cross, dot)))
+
+# Compile at import so the first request doesn't pay the JIT latency
+vector_angle(0.0, 1.0, 1.0, 0.0)
 
 def calculate_angle(a, b, c):
     """Calculate the angle at point b between points a, b, and c"""
     try:
-        a = np.array([a.x, a.y])
-        b = np.array([b.x, b.y])
-        c = np.array([c.x, c.y])
-        ba = a - b
-        bc = c - b
-        dot_product = np.dot(ba, bc)
-        norm_ba = np.linalg.norm(ba)
-        norm_bc = np.linalg.norm(bc)
-        if norm_ba < 1e-6 or norm_bc < 1e-6:
-            return 0.0
-        angle_rad = np.arccos(dot_product / (norm_ba * norm_bc))
-        angle_deg = np.degrees(angle_rad)
-        return angle_deg
+        return vector_angle(a.x - b.x, a.y - b.y, c.x - b.x, c.y - b.y)
     except Exception as e:
         logger.error(f"Angle calculation error: {str(e)}")
         return 0.0
@@ -37,104 +99,92 @@ def calculate_angle(a, b, c):
 def calculate_upright_back_angle(shoulder, hip):
     """Calculate how upright the torso is compared to vertical"""
     try:
-        vector = np.array([hip.x - shoulder.x, hip.y - shoulder.y])
-        vertical = np.array([0, 1])
-        norm = np.linalg.norm(vector)
-        if norm < 1e-6:
+        vx = hip.x - shoulder.x
+        vy = hip.y - shoulder.y
+        if abs(vx) < 1e-6 and abs(vy) < 1e-6:
             return 0.0
-        dot_product = np.dot(vector, vertical)
-        angle_rad = np.arccos(dot_product / norm)
-        angle_deg = np.degrees(angle_rad)
-        return angle_deg  # 0 = upright
+        return math.degrees(math.atan2(abs(vx), vy))  # 0 = upright
     except Exception as e:
         logger.error(f"Upright back angle error: {str(e)}")
         return 0.0
 
-def get_landmark(landmarks, landmark_id):
-    landmark = landmarks[landmark_id]
-    return landmark if landmark.visibility > 0.5 else None
+def _landmark_array(landmarks):
+    """Materialize all landmarks into an (N, 4) x/y/z/visibility array"""
+    return np.fromiter(
+        (v for lm in landmarks for v in (lm.x, lm.y, lm.z, lm.visibility)),
+        dtype=np.float32, count=len(landmarks) * 4).reshape(-1, 4)
+
+def get_landmark(landmark_arr, landmark_id):
+    row = landmark_arr[landmark_id]
+    return Pt(float(row[0]), float(row[1])) if row[3] > 0.5 else None
 
 def analyze_sitting(frame):
+    # Unexpected errors propagate to the caller: the video path formats
+    # them in analyze_single_frame, the frame endpoints let them reach
+    # their handlers so transient failures are never cached
+    if frame is None or frame.size == 0:
+        return False, ["Empty frame received"]
+
+    results = _get_pose().process(_to_rgb(_downscale(frame)))
+    if not results.pose_landmarks:
+        return False, ["No body detected - ensure full visibility"]
+
+    # One pass over the protobuf; the lookups below are then plain
+    # array indexing instead of repeated per-attribute round-trips
+    landmark_arr = _landmark_array(results.pose_landmarks.landmark)
+    feedback = []
+
+    left_shoulder = get_landmark(landmark_arr, LEFT_SHOULDER)
+    right_shoulder = get_landmark(landmark_arr, RIGHT_SHOULDER)
+    left_hip = get_landmark(landmark_arr, LEFT_HIP)
+    right_hip = get_landmark(landmark_arr, RIGHT_HIP)
+    left_ear = get_landmark(landmark_arr, LEFT_EAR)
+    right_ear = get_landmark(landmark_arr, RIGHT_EAR)
+    nose = get_landmark(landmark_arr, NOSE)
+
+    # Midpoints
+    shoulder = None
+    if left_shoulder and right_shoulder:
+        shoulder = Pt((left_shoulder.x + right_shoulder.x) * 0.5,
+                      (left_shoulder.y + right_shoulder.y) * 0.5)
+    elif left_shoulder:
+        shoulder = left_shoulder
+    elif right_shoulder:
+        shoulder = right_shoulder
+
+    hip = None
+    if left_hip and right_hip:
+        hip = Pt((left_hip.x + right_hip.x) * 0.5,
+                 (left_hip.y + right_hip.y) * 0.5)
+    elif left_hip:
+        hip = left_hip
+    elif right_hip:
+        hip = right_hip
+
+    ear = left_ear or right_ear
+
+    if not all([shoulder, hip, ear, nose]):
+        return False, ["Key body points not visible - adjust position"]
+
+    # Neck bend - Modified calculation
     try:
-        if frame is None or frame.size == 0:
-            return False, ["Empty frame received"]
-
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(rgb_frame)
-        if not results.pose_landmarks:
-            return False, ["No body detected - ensure full visibility"]
-
-        landmarks = results.pose_landmarks.landmark
-        feedback = []
-
-        left_shoulder = get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_SHOULDER)
-        right_shoulder = get_landmark(landmarks, mp_pose.PoseLandmark.RIGHT_SHOULDER)
-        left_hip = get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_HIP)
-        right_hip = get_landmark(landmarks, mp_pose.PoseLandmark.RIGHT_HIP)
-        left_ear = get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_EAR)
-        right_ear = get_landmark(landmarks, mp_pose.PoseLandmark.RIGHT_EAR)
-        nose = get_landmark(landmarks, mp_pose.PoseLandmark.NOSE)
-
-        # Midpoints
-        shoulder = None
-        if left_shoulder and right_shoulder:
-            shoulder = type('', (), {})()
-            shoulder.x = (left_shoulder.x + right_shoulder.x) / 2
-            shoulder.y = (left_shoulder.y + right_shoulder.y) / 2
-        elif left_shoulder:
-            shoulder = left_shoulder
-        elif right_shoulder:
-            shoulder = right_shoulder
-
-        hip = None
-        if left_hip and right_hip:
-            hip = type('', (), {})()
-            hip.x = (left_hip.x + right_hip.x) / 2
-            hip.y = (left_hip.y + right_hip.y) / 2
-        elif left_hip:
-            hip = left_hip
-        elif right_hip:
-            hip = right_hip
-
-        ear = left_ear or right_ear
-
-        if not all([shoulder, hip, ear, nose]):
-            return False, ["Key body points not visible - adjust position"]
-
-        # Neck bend - Modified calculation
-        try:
-            # Vector from ear to shoulder (down the neck)
-            neck_vector = np.array([shoulder.x - ear.x, shoulder.y - ear.y])
-            # Vector from ear to nose (forward direction)
-            head_vector = np.array([nose.x - ear.x, nose.y - ear.y])
-            
-            # Calculate angle between these vectors
-            dot_product = np.dot(neck_vector, head_vector)
-            norm_neck = np.linalg.norm(neck_vector)
-            norm_head = np.linalg.norm(head_vector)
-            
-            if norm_neck < 1e-6 or norm_head < 1e-6:
-                neck_bend = 0.0
-            else:
-                angle_rad = np.arccos(dot_product / (norm_neck * norm_head))
-                neck_bend = np.degrees(angle_rad)
-            
-            # Desk sitting rule: Flag if neck bends >30°
-            if neck_bend > 30:
-                feedback.append(f"Neck bending forward: {int(neck_bend)}° (exceeds 30° threshold)")
-        except Exception as e:
-            logger.error(f"Neck angle error: {str(e)}")
-
-        # Upright back (unchanged as requested)
-        try:
-            upright_angle = calculate_upright_back_angle(shoulder, hip)
-            if upright_angle > 15:
-                feedback.append(f"Back is leaning: {int(upright_angle)}° from vertical")
-        except Exception as e:
-            logger.error(f"Back angle error: {str(e)}")
-
-        return True, feedback
+        # Angle between the neck vector (ear to shoulder) and the
+        # forward head vector (ear to nose)
+        neck_bend = vector_angle(shoulder.x - ear.x, shoulder.y - ear.y,
+                                 nose.x - ear.x, nose.y - ear.y)
+
+        # Desk sitting rule: Flag if neck bends >30°
+        if neck_bend > 30:
+            feedback.append(f"Neck bending forward: {int(neck_bend)}° (exceeds 30° threshold)")
+    except Exception as e:
+        logger.error(f"Neck angle error: {str(e)}")
 
+    # Upright back (unchanged as requested)
+    try:
+        upright_angle = calculate_upright_back_angle(shoulder, hip)
+        if upright_angle > 15:
+            feedback.append(f"Back is leaning: {int(upright_angle)}° from vertical")
     except Exception as e:
-        logger.exception(f"Sitting analysis failed: {str(e)}")
-        return False, [f"Analysis error: {str(e)}"]
\ No newline at end of file
+        logger.error(f"Back angle error: {str(e)}")
+
+    return True, feedback
\ No newline at end of file
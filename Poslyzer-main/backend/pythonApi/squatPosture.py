@@ -1,39 +1,110 @@
 import cv2
 import mediapipe as mp
 import math
+import threading
+import numpy as np
 
-# Initialize MediaPipe
+# Initialize MediaPipe lazily, one Pose per thread: Pose objects are not
+# thread-safe and the video path analyzes frames on worker threads
 mp_pose = mp.solutions.pose
-pose = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
 mp_drawing = mp.solutions.drawing_utils
+_thread_local = threading.local()
 
-# Helper function to calculate angle
-def calculate_angle(a, b, c):
-    a = [a.x, a.y]
-    b = [b.x, b.y]
-    c = [c.x, c.y]
-    radians = math.atan2(c[1]-b[1], c[0]-b[0]) - math.atan2(a[1]-b[1], a[0]-b[0])
+def _get_pose():
+    pose = getattr(_thread_local, 'pose', None)
+    if pose is None:
+        pose = mp_pose.Pose(min_detection_confidence=0.5,
+                            min_tracking_confidence=0.5)
+        _thread_local.pose = pose
+    return pose
+
+# MediaPipe Pose detects at 256x256 internally, so feeding it more than
+# ~480px on the long edge only adds cvtColor/copy bandwidth, not accuracy
+MAX_INFERENCE_EDGE = 480
+
+def _downscale(frame):
+    """Shrink frame so its long edge is at most MAX_INFERENCE_EDGE"""
+    h, w = frame.shape[:2]
+    scale = MAX_INFERENCE_EDGE / max(h, w)
+    if scale < 1.0:
+        frame = cv2.resize(frame, None, fx=scale, fy=scale,
+                           interpolation=cv2.INTER_AREA)
+    return frame
+
+def _to_rgb(frame):
+    """Convert BGR to RGB into a reusable per-thread buffer"""
+    # Note: a frame[:, :, ::-1] view would skip cvtColor entirely, but
+    # MediaPipe needs contiguous input, and np.ascontiguousarray on the
+    # view allocates a fresh frame-sized copy per call - strictly worse
+    # than converting into this reused buffer
+    buf = getattr(_thread_local, 'rgb_buf', None)
+    if buf is None or buf.shape != frame.shape:
+        buf = np.empty_like(frame)
+        _thread_local.rgb_buf = buf
+    buf.flags.writeable = True
+    cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buf)
+    # Marking the buffer read-only lets MediaPipe skip its internal copy
+    buf.flags.writeable = False
+    return buf
+
+# Numba is optional: when present the scalar geometry kernel compiles to
+# native code, otherwise it runs as plain Python
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def wrap(func):
+            return func
+        return wrap
+
+@njit(cache=True, fastmath=True)
+def _angle_deg(ax, ay, bx, by, cx, cy):
+    radians = math.atan2(cy - by, cx - bx) - math.atan2(ay - by, ax - bx)
     angle = abs(radians * 180.0 / math.pi)
-    return 360 - angle if angle > 180 else angle
+    return 360.0 - angle if angle > 180.0 else angle
+
+# Compile at import so the first request doesn't pay the JIT latency
+_angle_deg(0.0, 0.0, 1.0, 0.0, 1.0, 1.0)
+
+# Landmark indices as plain ints, resolved once instead of paying the
+# IntEnum attribute lookup on every frame
+LEFT_SHOULDER = int(mp_pose.PoseLandmark.LEFT_SHOULDER)
+LEFT_HIP = int(mp_pose.PoseLandmark.LEFT_HIP)
+LEFT_KNEE = int(mp_pose.PoseLandmark.LEFT_KNEE)
+LEFT_ANKLE = int(mp_pose.PoseLandmark.LEFT_ANKLE)
+LEFT_FOOT_INDEX = int(mp_pose.PoseLandmark.LEFT_FOOT_INDEX)
+
+def _landmark_array(landmarks):
+    """Materialize all landmarks into an (N, 4) x/y/z/visibility array"""
+    return np.fromiter(
+        (v for lm in landmarks for v in (lm.x, lm.y, lm.z, lm.visibility)),
+        dtype=np.float32, count=len(landmarks) * 4).reshape(-1, 4)
+
+# Helper function to calculate angle between landmark rows
+def calculate_angle(a, b, c):
+    return _angle_deg(a[0], a[1], b[0], b[1], c[0], c[1])
 
-# Helper to check visibility
+# Helper to check visibility of a landmark row
 def is_visible(landmark, threshold=0.5):
-    return landmark.visibility > threshold
+    return landmark[3] > threshold
 
 # Main squat analysis function
-def analyze_squat(frame):
-    result = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+def analyze_squat(frame, draw=False):
+    frame = _downscale(frame)
+    result = _get_pose().process(_to_rgb(frame))
     feedback = []
 
     if result.pose_landmarks:
-        landmarks = result.pose_landmarks.landmark
+        # One pass over the protobuf; the lookups below are then plain
+        # array indexing instead of repeated per-attribute round-trips
+        landmarks = _landmark_array(result.pose_landmarks.landmark)
 
         # Required landmarks
-        left_knee = landmarks[mp_pose.PoseLandmark.LEFT_KNEE]
-        left_ankle = landmarks[mp_pose.PoseLandmark.LEFT_ANKLE]
-        left_hip = landmarks[mp_pose.PoseLandmark.LEFT_HIP]
-        left_shoulder = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER]
-        left_foot = landmarks[mp_pose.PoseLandmark.LEFT_FOOT_INDEX]
+        left_knee = landmarks[LEFT_KNEE]
+        left_ankle = landmarks[LEFT_ANKLE]
+        left_hip = landmarks[LEFT_HIP]
+        left_shoulder = landmarks[LEFT_SHOULDER]
+        left_foot = landmarks[LEFT_FOOT_INDEX]
 
         # Visibility check
         keypoints = [left_knee, left_ankle, left_hip, left_shoulder, left_foot]
@@ -51,8 +122,10 @@ def analyze_squat(frame):
         if back_angle < 150:
             feedback.append(f"Back too bent: {int(back_angle)}°")
 
-        # Draw pose landmarks
-        mp_drawing.draw_landmarks(frame, result.pose_landmarks, mp_pose.POSE_CONNECTIONS)
+        # Draw pose landmarks only when explicitly requested; callers on
+        # the analysis path discard the frame, so drawing is wasted work
+        if draw:
+            mp_drawing.draw_landmarks(frame, result.pose_landmarks, mp_pose.POSE_CONNECTIONS)
 
     else:
         feedback.append("Key body parts not detected")